@@ -0,0 +1,80 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+def cache_dir() -> Path:
+    """Directory for state that is safe to lose between runs (tokens, sessions)."""
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "lock_automation"
+
+
+@contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on a sidecar file so concurrent writers don't interleave."""
+    with open(path.with_name(path.name + ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_json(name: str) -> Any:
+    """
+    Reads a cached JSON document.
+
+    Args:
+        name (str): The file name within the cache directory.
+
+    Returns:
+        Any: The decoded document, or None if it is missing or unreadable.
+    """
+    try:
+        with open(cache_dir() / name, "rb") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(name: str, data: Any) -> None:
+    """
+    Atomically writes a JSON document to the cache, readable only by the current user.
+
+    Failures are logged and swallowed: the cache is an optimization, never a requirement.
+
+    Args:
+        name (str): The file name within the cache directory.
+        data (Any): A JSON-serializable document.
+    """
+    path = cache_dir() / name
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with _locked(path):
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+    except OSError:
+        logger.warning("Failed to write cache file %s", path, exc_info=True)
+
+
+def delete(name: str) -> None:
+    """Removes a cached document if it exists."""
+    path = cache_dir() / name
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:
+        logger.warning("Failed to delete cache file %s", path, exc_info=True)
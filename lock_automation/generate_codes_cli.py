@@ -1,11 +1,15 @@
 import argparse
 import logging
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import date, datetime, timedelta
 from zoneinfo import ZoneInfo
 
 from .igloo import IglooClient
-from .play_by_point import PlayByPointClient
+from .play_by_point import EntryCodesResponse, PlayByPointClient
+
+# Upper bound on concurrent Igloo requests; each day's PIN is an independent HTTPS round-trip
+_MAX_PIN_WORKERS = 16
 
 
 def setup_logging() -> logging.Logger:
@@ -32,6 +36,31 @@ def create_pin_for_day(igloo: IglooClient, lock_id: str, day: date, tzinfo: Zone
     return daily_pin["pin"]
 
 
+def submit_pins(
+    executor: ThreadPoolExecutor, igloo: IglooClient, lock_id: str, days: list[date], tzinfo: ZoneInfo
+) -> dict[date, Future[str]]:
+    return {
+        day: executor.submit(create_pin_for_day, igloo=igloo, lock_id=lock_id, day=day, tzinfo=tzinfo) for day in days
+    }
+
+
+def days_missing_codes(days: list[date], entry_codes: EntryCodesResponse) -> list[date]:
+    """
+    Filters out days that already have a Playbypoint code.
+
+    Playbypoint keys codes by day of the month, so an existing code is assumed to be the one a previous run
+    generated for that date. The last day is always kept: no earlier run covered it, so any code there is stale.
+    """
+    existing_values = entry_codes.existing_values
+    missing = []
+    for day in days[:-1]:
+        variant_id = entry_codes.day_ids.get(str(day.day))
+        existing = existing_values.get(variant_id) if variant_id is not None else None
+        if existing is None or not existing.value:
+            missing.append(day)
+    return missing + days[-1:]
+
+
 def main() -> None:
     logger = setup_logging()
 
@@ -46,39 +75,70 @@ def main() -> None:
     parser.add_argument("--play-by-point-owner", required=True, help="Playbypoint owner ID")
     parser.add_argument("--timezone", required=True, help="Timezone string, e.g. 'America/Denver'")
     parser.add_argument("--num-days", type=int, default=14, help="Number of days to generate codes for (default: 14)")
+    parser.add_argument(
+        "--reuse-existing-codes",
+        action="store_true",
+        help="Only generate pins for days without a Playbypoint code. Codes are keyed by day of the month, so only "
+        "use this when the job runs every day.",
+    )
 
     args = parser.parse_args()
 
     igloo = IglooClient.from_client_credentials(client_id=args.igloo_client_id, client_secret=args.igloo_client_secret)
     tz = ZoneInfo(args.timezone)
     today = datetime.now(tz).date()
-    updated_codes: dict[str, str] = {}
+    updated_codes: dict[str, str | None] = {}
+
+    days = [today + timedelta(days=i) for i in range(1, args.num_days + 1)]
 
-    logger.info(f"Generating new lock pins for the next {args.num_days} days (starting tomorrow):")
-    for i in range(1, args.num_days + 1):
-        day = today + timedelta(days=i)
-        logger.info(f"Generating pin for {day.isoformat()}...")
+    with ThreadPoolExecutor(max_workers=max(1, min(args.num_days, _MAX_PIN_WORKERS))) as executor:
+        futures: dict[date, Future[str]] = {}
+        if not args.reuse_existing_codes:
+            logger.info("Generating new lock pins for the next %d days (starting tomorrow):", args.num_days)
+            futures = submit_pins(executor, igloo, args.igloo_lock_id, days, tz)
+
+        # Sign in and read the current rules while any PIN requests are in flight on the worker threads
+        logger.info("Logging in to Playbypoint...")
         try:
-            code = create_pin_for_day(igloo=igloo, lock_id=args.igloo_lock_id, day=day, tzinfo=tz)
-            updated_codes[str(day.day)] = code
-            logger.info(f"Successfully generated pin for {day.isoformat()}")
+            play_by_point = PlayByPointClient.get_or_login(
+                username=args.play_by_point_username, password=args.play_by_point_password
+            )
+            logger.info("Successfully logged in to Playbypoint")
         except Exception:
-            logger.exception(f"Failed to generate pin for {day.isoformat()}")
-            continue
+            logger.exception("Failed to log in to Playbypoint")
+            sys.exit(1)
 
-    logger.info("Logging in to Playbypoint...")
-    try:
-        play_by_point = PlayByPointClient.from_login(
-            username=args.play_by_point_username, password=args.play_by_point_password
-        )
-        logger.info("Successfully logged in to Playbypoint")
-    except Exception:
-        logger.exception("Failed to log in to Playbypoint")
-        sys.exit(1)
+        try:
+            entry_codes = play_by_point.fetch_entry_codes(owner_id=args.play_by_point_owner)
+        except Exception:
+            logger.exception("Failed to fetch Playbypoint entry codes")
+            sys.exit(1)
+
+        if args.reuse_existing_codes:
+            days = days_missing_codes(days, entry_codes)
+            logger.info("Generating new lock pins for %d of the next %d days without a code:", len(days), args.num_days)
+            futures = submit_pins(executor, igloo, args.igloo_lock_id, days, tz)
+
+        generated = 0
+        for day, future in futures.items():
+            try:
+                updated_codes[str(day.day)] = future.result()
+                generated += 1
+                logger.debug("Successfully generated pin for %s", day)
+            except Exception:
+                logger.exception("Failed to generate pin for %s", day)
+                if args.reuse_existing_codes:
+                    # The day's code is from last month and won't open the lock. Clear it so the next run sees the
+                    # day as missing, rather than skipping it until the date has passed.
+                    updated_codes[str(day.day)] = None
+
+    logger.info("Generated %d of %d pins", generated, len(futures))
 
     logger.info("Updating Playbypoint entry codes...")
     try:
-        play_by_point.update_entry_codes(owner_id=args.play_by_point_owner, codes=updated_codes)
+        play_by_point.update_entry_codes(
+            owner_id=args.play_by_point_owner, codes=updated_codes, entry_codes=entry_codes
+        )
         logger.info("Successfully updated Playbypoint entry codes")
     except Exception:
         logger.exception("Failed to update Playbypoint entry codes")
@@ -1,8 +1,17 @@
 import base64
+import hashlib
+import threading
+import time
+from collections.abc import Sequence
 from datetime import datetime
 from typing import Any, TypedDict, cast
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter, Retry
+
+from . import cache
+from .timeouts import MAX_RETRY_WAIT, REQUEST_TIMEOUT
 
 
 class DailyPinResponse(TypedDict):
@@ -10,8 +19,41 @@ class DailyPinResponse(TypedDict):
     pinId: str
 
 
+class _CappedRetry(Retry):
+    """A Retry that honours Retry-After, but never sleeps longer than MAX_RETRY_WAIT."""
+
+    def get_retry_after(self, response: Any) -> float | None:
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, MAX_RETRY_WAIT)
+
+
 class IglooClient:
-    _TIMEOUT = 10_000
+    _CREDENTIALS_CACHE_FILE = "igloo_token.json"
+    # Don't hand out a cached token that will expire mid-run
+    _TOKEN_EXPIRY_MARGIN = 60
+    # Minting an extra token is harmless, so the token request retries connection errors, read timeouts, 429 and
+    # 5xx with capped exponential backoff, honouring Retry-After
+    _TOKEN_RETRY = _CappedRetry(
+        total=4,
+        backoff_factor=0.5,
+        backoff_max=MAX_RETRY_WAIT,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    # API calls aren't idempotent: a PIN created by a request whose response was lost is valid on the lock, and a
+    # retry would create a second one. Only retry failures where the request was never processed.
+    _API_RETRY = _CappedRetry(
+        total=4,
+        connect=4,
+        read=0,
+        other=0,
+        backoff_factor=0.5,
+        backoff_max=MAX_RETRY_WAIT,
+        status_forcelist=(429, 503),
+        allowed_methods=None,
+        raise_on_status=False,
+    )
 
     def __init__(self, access_token: str):
         """
@@ -21,37 +63,113 @@ class IglooClient:
             access_token (str): The OAuth2 access token.
         """
         self._access_token = access_token
+        # Set by from_client_credentials so a token the API rejects can be replaced
+        self._credentials: tuple[str, str, str] | None = None
+        self._token_lock = threading.Lock()
+        # Share one keep-alive connection pool across calls so each PIN doesn't pay for a new TCP + TLS handshake
+        self._session = requests.Session()
+        self._session.headers.update({"Authorization": f"Bearer {access_token}"})
+        self._session.mount(
+            "https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=IglooClient._API_RETRY)
+        )
 
     @staticmethod
-    def from_client_credentials(*, client_id: str, client_secret: str) -> "IglooClient":
+    def from_client_credentials(
+        *, client_id: str, client_secret: str, scopes: Sequence[str] = ("igloohomeapi/algopin-hourly",)
+    ) -> "IglooClient":
         """
         Static factory method to create an IglooClient using client credentials.
 
+        Access tokens are cached on disk and reused across runs until shortly before they expire.
+
         Args:
             client_id (str): The OAuth client ID.
             client_secret (str): The OAuth client secret.
+            scopes (Sequence[str]): The OAuth scopes to request. Defaults to only what create_daily_pin needs.
 
         Returns:
             IglooClient: An instance of IglooClient with a valid access token.
         """
+        scope = " ".join(scopes)
+        cached = cache.read_json(IglooClient._CREDENTIALS_CACHE_FILE)
+        if (
+            isinstance(cached, dict)
+            and cached.get("credentials") == IglooClient._credentials_hash(client_id, client_secret)
+            and cached.get("scope") == scope
+            and cached.get("expires_at", 0) - time.time() > IglooClient._TOKEN_EXPIRY_MARGIN
+        ):
+            client = IglooClient(cached["access_token"])
+        else:
+            client = IglooClient(IglooClient._fetch_token(client_id, client_secret, scope))
+        client._credentials = (client_id, client_secret, scope)
+        return client
+
+    @staticmethod
+    def _credentials_hash(client_id: str, client_secret: str) -> str:
+        # Ties a cached token to the secret that minted it, without writing the secret to disk
+        return hashlib.sha256(f"{client_id}:{client_secret}".encode()).hexdigest()
+
+    @staticmethod
+    def _fetch_token(client_id: str, client_secret: str, scope: str) -> str:
+        """Requests a new access token and caches it on disk."""
         basic_auth = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
         headers = {"Authorization": f"Basic {basic_auth}", "Content-Type": "application/x-www-form-urlencoded"}
         data = {
             "grant_type": "client_credentials",
-            # NOTE(thomas): We get all the scopes here, which kinda violates least privilege but ok
-            "scope": "igloohomeapi/algopin-hourly igloohomeapi/algopin-daily igloohomeapi/algopin-permanent igloohomeapi/algopin-onetime igloohomeapi/create-pin-bridge-proxied-job igloohomeapi/delete-pin-bridge-proxied-job igloohomeapi/lock-bridge-proxied-job igloohomeapi/unlock-bridge-proxied-job igloohomeapi/get-device-status-bridge-proxied-job igloohomeapi/get-battery-level-bridge-proxied-job igloohomeapi/get-activity-logs-bridge-proxied-job igloohomeapi/get-devices igloohomeapi/get-job-status",
+            "scope": scope,
         }
-        response = requests.post(
-            "https://auth.igloohome.co/oauth2/token", headers=headers, data=data, timeout=IglooClient._TIMEOUT
-        )
+        with requests.Session() as session:
+            session.mount("https://", HTTPAdapter(max_retries=IglooClient._TOKEN_RETRY))
+            response = session.post(
+                "https://auth.igloohome.co/oauth2/token", headers=headers, data=data, timeout=REQUEST_TIMEOUT
+            )
         response.raise_for_status()
-        access_token = response.json().get("access_token")
-        return IglooClient(access_token)
+        token_json = orjson.loads(response.content)
+        access_token: str = token_json.get("access_token")
+        if "expires_in" in token_json:
+            cache.write_json(
+                IglooClient._CREDENTIALS_CACHE_FILE,
+                {
+                    "credentials": IglooClient._credentials_hash(client_id, client_secret),
+                    "scope": scope,
+                    "access_token": access_token,
+                    "expires_at": time.time() + token_json["expires_in"],
+                },
+            )
+        return access_token
+
+    def _refresh_token(self, stale_token: str) -> bool:
+        """
+        Replaces an access token the API rejected, unless a concurrent request already has.
+
+        Returns:
+            bool: True if the client now holds a token other than stale_token.
+        """
+        if self._credentials is None:
+            return False
+        with self._token_lock:
+            if self._access_token != stale_token:
+                return True
+            cache.delete(IglooClient._CREDENTIALS_CACHE_FILE)
+            self._access_token = IglooClient._fetch_token(*self._credentials)
+            self._session.headers["Authorization"] = f"Bearer {self._access_token}"
+            return True
+
+    def _post(self, url: str, data: dict[str, Any]) -> requests.Response:
+        access_token = self._access_token
+        response = self._session.post(url, json=data, timeout=REQUEST_TIMEOUT)
+        # A cached token may have been revoked before it expired; mint a new one and retry once
+        if response.status_code == 401 and self._refresh_token(access_token):
+            response = self._session.post(url, json=data, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response
 
     def unlock(self, *, lock_id: str, bridge_id: str) -> Any:
         """
         Sends an unlock command to the specified lock via the specified bridge.
 
+        Requires a client created with the igloohomeapi/unlock-bridge-proxied-job scope.
+
         Args:
             lock_id (str): The ID of the lock to unlock.
             bridge_id (str): The ID of the bridge to use.
@@ -63,11 +181,9 @@ class IglooClient:
             requests.HTTPError: If the API request fails.
         """
         url = f"https://api.igloodeveloper.co/igloohome/devices/{lock_id}/jobs/bridges/{bridge_id}"
-        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self._access_token}"}
         data = {"jobType": 2}
-        response = requests.post(url, headers=headers, json=data, timeout=IglooClient._TIMEOUT)
-        response.raise_for_status()
-        return response.json()
+        response = self._post(url, data)
+        return orjson.loads(response.content)
 
     def create_daily_pin(
         self, *, lock_id: str, start_date: datetime, end_date: datetime, access_name: str
@@ -88,13 +204,11 @@ class IglooClient:
             requests.HTTPError: If the API request fails.
         """
         url = f"https://api.igloodeveloper.co/igloohome/devices/{lock_id}/algopin/hourly"
-        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self._access_token}"}
         data = {
             "variance": 1,
             "startDate": start_date.isoformat(),
             "endDate": end_date.isoformat(),
             "accessName": access_name,
         }
-        response = requests.post(url, headers=headers, json=data, timeout=IglooClient._TIMEOUT)
-        response.raise_for_status()
-        return cast(DailyPinResponse, response.json())
+        response = self._post(url, data)
+        return cast(DailyPinResponse, orjson.loads(response.content))
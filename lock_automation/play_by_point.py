@@ -1,215 +1,616 @@
-import json
+import atexit
+import hashlib
 import logging
-from collections.abc import Mapping
-from typing import Any, TypedDict
-
-from playwright.sync_api import Browser, BrowserContext, Page, Playwright, sync_playwright
+import queue
+import random
+import re
+import threading
+import time
+from collections.abc import Callable, Mapping
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, TypeVar
+from urllib.parse import urlencode
+
+import orjson
+import requests
+from playwright.sync_api import Browser, Page, Playwright, sync_playwright
+from playwright.sync_api import Error as PlaywrightError
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from requests.adapters import HTTPAdapter
+
+from . import cache
+from .timeouts import MAX_RETRY_WAIT, REQUEST_TIMEOUT
 
 logger = logging.getLogger(__name__)
 
-
-class ExistingEntryCode(TypedDict):
+_T = TypeVar("_T")
+
+# Distinguishes "no update for this day" from an explicit None (clear the code)
+_MISSING = object()
+# Shared default for absent lists in API payloads, so lookups don't allocate a fresh [] each time
+_EMPTY: tuple[Any, ...] = ()
+
+# Signed-in clients are reused across get_or_login calls until they get too old or have been handed out too often
+_POOL_MAX_AGE = 30 * 60
+_POOL_MAX_USES = 50
+_pool: dict[str, tuple["PlayByPointClient", float, int]] = {}  # username -> (client, created_at, uses)
+# Rejected clients evict themselves from worker threads
+_pool_lock = threading.Lock()
+
+# Chromium is launched on the first from_login and shared by later ones; each login gets its own context
+_playwright: Playwright | None = None
+_browser: Browser | None = None
+# Playwright's sync API only works on the thread that started it, so all browser work is queued to one thread. A
+# daemon thread outlives atexit handlers, which lets close_all shut the browser down cleanly.
+_browser_thread: threading.Thread | None = None
+_browser_thread_lock = threading.Lock()
+_browser_calls: queue.SimpleQueue[tuple[Callable[[], Any], Future[Any]]] = queue.SimpleQueue()
+
+_SIGN_IN_URL = "https://app.playbypoint.com/users/sign_in"
+_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+# Also the connection pool size, so concurrent requests never wait on a connection
+_MAX_CONCURRENT_REQUESTS = 8
+# Transient failures are retried with jittered exponential backoff
+_MAX_ATTEMPTS = 5
+_BACKOFF_BASE = 0.5
+_RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+# Total time Cloudflare gets to clear its challenge and show the login form, in milliseconds
+_CHALLENGE_TIMEOUT_MS = 60000
+_BLOCKED_RESOURCE_TYPES = frozenset(("image", "font", "stylesheet", "media"))
+_CSRF_RE = re.compile(rb'<meta\s+name="csrf-token"\s+content="([^"]+)"')
+# Responses that may mean the CSRF token went stale (Rails answers an invalid authenticity token with 422); the
+# token is refreshed and the request retried once
+_CSRF_REJECTED_STATUSES = frozenset((401, 403, 422))
+
+
+def _is_cloudflare_challenge(response: requests.Response) -> bool:
+    return (
+        response.status_code in (403, 429, 503)
+        and response.headers.get("Server", "").startswith("cloudflare")
+        and (b"challenge-platform" in response.content or b"jschl_vc" in response.content)
+    )
+
+
+def _backoff_delay(attempt: int, response: requests.Response | None) -> float:
+    delay = min(MAX_RETRY_WAIT, _BACKOFF_BASE * 2.0**attempt) * (0.5 + random.random())  # noqa: S311
+    retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+    if retry_after.isdigit():
+        delay = max(delay, min(MAX_RETRY_WAIT, int(retry_after)))
+    return delay
+
+
+@dataclass(slots=True)
+class ExistingEntryCode:
     id: int
     value: str
 
 
-class EntryCodesResponse(TypedDict):
+@dataclass(slots=True)
+class EntryCodesResponse:
     rule_id: int
     variant_id: int
     day_ids: dict[str, int]
     existing_values: dict[int, ExistingEntryCode]  # variant_id -> ExistingEntryCode
 
 
+def _run_on_browser_thread(fn: Callable[[], _T]) -> _T:
+    """Calls fn on the browser thread, starting the thread if needed, and returns its result."""
+    global _browser_thread
+    with _browser_thread_lock:
+        if _browser_thread is None:
+            _browser_thread = threading.Thread(target=_serve_browser_calls, name="playwright", daemon=True)
+            _browser_thread.start()
+    if threading.current_thread() is _browser_thread:
+        return fn()
+    future: Future[_T] = Future()
+    _browser_calls.put((fn, future))
+    return future.result()
+
+
+def _serve_browser_calls() -> None:
+    while True:
+        fn, future = _browser_calls.get()
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+
+
+def _get_browser() -> Browser:
+    """Returns the process-wide headless Chromium, launching it if it isn't running. Only call on the browser thread."""
+    global _playwright, _browser
+    if _browser is None or not _browser.is_connected():
+        _close_browser()
+        _playwright = sync_playwright().start()
+        _browser = _playwright.chromium.launch(
+            headless=True,
+            args=[
+                "--disable-blink-features=AutomationControlled",
+                "--no-sandbox",
+                "--disable-dev-shm-usage",
+                "--disable-gpu",
+            ],
+        )
+    return _browser
+
+
+def _close_browser() -> None:
+    global _playwright, _browser
+    try:
+        if _browser is not None:
+            _browser.close()
+        if _playwright is not None:
+            _playwright.stop()
+    except PlaywrightError:
+        logger.warning("Failed to shut down Playwright", exc_info=True)
+    finally:
+        _playwright = _browser = None
+
+
 def _parse_entry_codes(payload: list[dict[str, Any]]) -> EntryCodesResponse:
     for rule in payload:
         if rule["display_name"] != "Entry Access Codes":
             continue
 
-        day_variant = next((v for v in rule.get("variants", []) if v.get("display_name") == "Day"), None)
+        variants_by_name = {v.get("display_name"): v for v in rule.get("variants", _EMPTY)}
+        day_variant = variants_by_name.get("Day")
         if not day_variant:
             raise ValueError("Couldn't find Day variant")
 
-        day_ids = {v["text"]: v["value"] for v in day_variant.get("values", [])}
+        day_ids = {v["text"]: v["value"] for v in day_variant.get("values", _EMPTY)}
 
-        existing_values: dict[int, ExistingEntryCode] = {}
-        for val in rule.get("values", []):
-            for variant in val.get("variants", []):
-                variant_id = variant["rule_variant_item_id"]
-                existing_values[variant_id] = {"id": val["id"], "value": val["value"]}
-
-        return {
-            "rule_id": rule["id"],
-            "variant_id": day_variant["id"],
-            "day_ids": day_ids,
-            "existing_values": existing_values,
+        existing_values: dict[int, ExistingEntryCode] = {
+            variant["rule_variant_item_id"]: ExistingEntryCode(id=val["id"], value=val["value"])
+            for val in rule.get("values", _EMPTY)
+            for variant in val.get("variants", _EMPTY)
         }
 
+        return EntryCodesResponse(
+            rule_id=rule["id"], variant_id=day_variant["id"], day_ids=day_ids, existing_values=existing_values
+        )
+
     raise ValueError("Couldn't find EntryAccessCodes")
 
 
+def _has_changes(*, entry_codes: EntryCodesResponse, updated_codes: Mapping[str, str | None]) -> bool:
+    existing_values = entry_codes.existing_values
+    for day, code in updated_codes.items():
+        variant_id = entry_codes.day_ids.get(day)
+        if variant_id is None:
+            # Days the rule doesn't have are never written
+            continue
+        existing = existing_values.get(variant_id)
+        if (existing.value if existing is not None else None) != code:
+            return True
+    return False
+
+
 def _build_update_payload(
     *, owner_id: str, entry_codes: EntryCodesResponse, updated_codes: Mapping[str, str | None]
-) -> dict[str, Any]:
-    payload: dict[str, Any] = {"rule[id]": entry_codes["rule_id"], "owner": owner_id}
-
-    for i, (day, variant_id) in enumerate(entry_codes["day_ids"].items()):
-        if day in updated_codes:
-            code = updated_codes[day]
-            if code is None:
-                # Omitting from the payload will clear it if it exists, or do nothing if it doesn't
+) -> list[tuple[str, Any]]:
+    rule_id_str = str(entry_codes.rule_id)
+    variant_id_str = str(entry_codes.variant_id)
+    payload: list[tuple[str, Any]] = [("rule[id]", rule_id_str), ("owner", owner_id)]
+
+    existing_values = entry_codes.existing_values
+    for i, (day, variant_id) in enumerate(entry_codes.day_ids.items()):
+        existing = existing_values.get(variant_id)
+        code = updated_codes.get(day, _MISSING)
+        if code is None:
+            # Omitting from the payload will clear it if it exists, or do nothing if it doesn't
+            continue
+        if code is _MISSING:
+            if existing is None:
+                # No update and no existing value
                 continue
-        elif variant_id in entry_codes["existing_values"]:
             # Preserve existing code
-            code = entry_codes["existing_values"][variant_id]["value"]
-        else:
-            # No update and no existing value
-            continue
+            code = existing.value
 
         prefix = f"rule[values_attributes][{i}]"
 
-        if variant_id in entry_codes["existing_values"]:
+        if existing is not None:
             # We have to include these fields for an update
-            existing = entry_codes["existing_values"][variant_id]
-            payload[f"{prefix}[id]"] = existing["id"]
+            payload.append((f"{prefix}[id]", existing.id))
 
         # We always include these fields for a write
-        payload[f"{prefix}[rule_id]"] = entry_codes["rule_id"]
-        payload[f"{prefix}[value]"] = code
-        payload[f"{prefix}[value_variants_attributes][0][variant_rule_id]"] = entry_codes["variant_id"]
-        payload[f"{prefix}[value_variants_attributes][0][rule_variant_item_id]"] = str(variant_id)
+        payload.extend([
+            (f"{prefix}[rule_id]", rule_id_str),
+            (f"{prefix}[value]", code),
+            (f"{prefix}[value_variants_attributes][0][variant_rule_id]", variant_id_str),
+            (f"{prefix}[value_variants_attributes][0][rule_variant_item_id]", str(variant_id)),
+        ])
 
     return payload
 
 
 class PlayByPointClient:
-    def __init__(self, playwright: Playwright, browser: Browser, context: BrowserContext, page: Page):
-        self._playwright = playwright
-        self._browser = browser
-        self._context = context
-        self._page = page
+    def __init__(self, session: requests.Session):
+        """
+        Public constructor for PlayByPointClient.
+
+        Args:
+            session (requests.Session): A session carrying signed-in cookies and the X-CSRF-Token header.
+        """
+        self._session = session
+        self._csrf_lock = threading.Lock()
+        # Set by get_or_login so a client whose session is rejected can sign in again
+        self._credentials: tuple[str, str] | None = None
+        self._relogin_lock = threading.Lock()
+        # Sessions replaced by a re-login; other threads may still be using them, so they are closed with the client
+        self._retired_sessions: list[requests.Session] = []
+
+    @staticmethod
+    def get_or_login(*, username: str, password: str) -> "PlayByPointClient":
+        """
+        Returns a signed-in client for the user, reusing a pooled one if it is still fresh.
+
+        Otherwise the session cached on disk by the last login is tried before signing in from scratch.
+
+        Pooled clients are closed when they are recycled or at interpreter exit. A client whose session is rejected
+        (HTTP 401/403) signs in again with these credentials; if that fails it is dropped from the pool, so the next
+        call starts over.
+
+        Args:
+            username (str): The Playbypoint username (email).
+            password (str): The Playbypoint password.
+
+        Returns:
+            PlayByPointClient: A signed-in client.
+        """
+        with _pool_lock:
+            entry = _pool.pop(username, None)
+            if entry is not None:
+                client, created_at, uses = entry
+                if time.monotonic() - created_at < _POOL_MAX_AGE and uses < _POOL_MAX_USES:
+                    _pool[username] = (client, created_at, uses + 1)
+                    return client
+        if entry is not None:
+            client.close()
+
+        client = PlayByPointClient.from_cached_session(username=username) or PlayByPointClient.from_login(
+            username=username, password=password
+        )
+        client._credentials = (username, password)
+        with _pool_lock:
+            _pool[username] = (client, time.monotonic(), 1)
+        return client
+
+    @staticmethod
+    def _new_session(cookies: list[dict[str, Any]]) -> requests.Session:
+        session = requests.Session()
+        # Cloudflare ties its clearance cookie to the user agent that solved the challenge
+        session.headers["User-Agent"] = _USER_AGENT
+        # Keep the TCP + TLS connection alive between the rules GET and PUT
+        session.mount(
+            "https://app.playbypoint.com", HTTPAdapter(pool_connections=4, pool_maxsize=_MAX_CONCURRENT_REQUESTS)
+        )
+        for cookie in cookies:
+            session.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain", ""),
+                path=cookie.get("path", "/"),
+                secure=cookie.get("secure", False),
+            )
+        return session
+
+    @staticmethod
+    def _session_cache_file(username: str) -> str:
+        return f"playbypoint-session-{hashlib.sha256(username.encode()).hexdigest()}.json"
+
+    @staticmethod
+    def from_cached_session(*, username: str) -> "PlayByPointClient | None":
+        """
+        Restores the session saved by the last successful from_login for the user, if it is still signed in.
+
+        Args:
+            username (str): The Playbypoint username (email).
+
+        Returns:
+            PlayByPointClient | None: A signed-in client, or None if there is no usable cached session.
+        """
+        cache_file = PlayByPointClient._session_cache_file(username)
+        cached = cache.read_json(cache_file)
+        if not isinstance(cached, dict) or not cached.get("cookies"):
+            return None
+
+        session = PlayByPointClient._new_session(cached["cookies"])
+        try:
+            csrf_token = PlayByPointClient._fetch_csrf_token(session)
+        except requests.RequestException:
+            # Keep the cache: the session may well still be signed in once the network or server recovers
+            logger.warning("Failed to restore cached Playbypoint session", exc_info=True)
+            session.close()
+            return None
+        if csrf_token is None:
+            session.close()
+            cache.delete(cache_file)
+            return None
+
+        session.headers["X-CSRF-Token"] = csrf_token
+        logger.info("Restored cached Playbypoint session")
+        return PlayByPointClient(session)
+
+    @staticmethod
+    def _fetch_csrf_token(session: requests.Session) -> str | None:
+        """
+        Returns a fresh CSRF token for the session, or None if it is no longer signed in.
+
+        Raises:
+            requests.RequestException: If the probe fails for any other reason, e.g. a network error or a 5xx.
+        """
+        # Signed-in users are redirected away from the sign-in page, which makes it a cheap session probe
+        response = session.get(_SIGN_IN_URL, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        if "sign_in" in response.url:
+            return None
+        csrf_match = _CSRF_RE.search(response.content)
+        if csrf_match is None:
+            raise requests.RequestException(f"No CSRF token on {response.url}", response=response)
+        return csrf_match.group(1).decode()
 
     @staticmethod
     def from_login(*, username: str, password: str) -> "PlayByPointClient":
-        # Use Playwright to handle Cloudflare protection
-        # Note: We keep the browser open for subsequent API calls
-        playwright = sync_playwright().start()
-        browser = playwright.chromium.launch(
-            headless=True,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--no-sandbox",
-                "--disable-dev-shm-usage",
-                "--disable-gpu",
-            ],
+        # Use Playwright to get through Cloudflare protection and sign in, then hand the cookies to requests
+        csrf_token, cookies = _run_on_browser_thread(
+            lambda: PlayByPointClient._browser_login(username=username, password=password)
         )
-        context = browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-            "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+
+        logger.info("Login successful")
+        # Cloudflare clearance and the Rails session live in cookies; keep them so the next run can skip all of this
+        cache.write_json(PlayByPointClient._session_cache_file(username), {"cookies": cookies})
+
+        session = PlayByPointClient._new_session(cookies)
+        session.headers["X-CSRF-Token"] = csrf_token
+        return PlayByPointClient(session)
+
+    @staticmethod
+    def _browser_login(*, username: str, password: str) -> tuple[str, list[dict[str, Any]]]:
+        """Signs in in a fresh browser context and returns the CSRF token and cookies."""
+        context = _get_browser().new_context(
+            user_agent=_USER_AGENT,
             viewport={"width": 1920, "height": 1080},
             locale="en-US",
             timezone_id="America/New_York",
         )
-        page = context.new_page()
-
-        # Hide webdriver property and other automation indicators
-        page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
-            Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]});
-            Object.defineProperty(navigator, 'languages', {get: () => ['en-US', 'en']});
-            window.chrome = {runtime: {}};
-        """)
+        try:
+            # Hide webdriver property and other automation indicators on every page in the context
+            context.add_init_script("""
+                Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
+                Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]});
+                Object.defineProperty(navigator, 'languages', {get: () => ['en-US', 'en']});
+                window.chrome = {runtime: {}};
+            """)
+            # Nothing we need from the login flow is rendered; scripts still load so Cloudflare can run its challenge
+            context.route(
+                "**/*",
+                lambda route: (
+                    route.abort() if route.request.resource_type in _BLOCKED_RESOURCE_TYPES else route.continue_()
+                ),
+            )
+            csrf_token = PlayByPointClient._sign_in(context.new_page(), username=username, password=password)
+            cookies = [dict(cookie) for cookie in context.cookies()]
+        finally:
+            context.close()
+        return csrf_token, cookies
 
+    @staticmethod
+    def _sign_in(page: Page, *, username: str, password: str) -> str:
+        """Signs in through the browser and returns the CSRF token of the signed-in page."""
         # Navigate to login page
         logger.info("Navigating to login page...")
-        page.goto("https://app.playbypoint.com/users/sign_in", wait_until="domcontentloaded")
+        page.goto(_SIGN_IN_URL, wait_until="domcontentloaded")
 
-        # Wait for Cloudflare challenge to complete (if any) by waiting for login form
-        # with retries, as Cloudflare may take time to verify
-        logger.info("Waiting for login form (Cloudflare may take time)...")
+        # Cloudflare's interstitial is small and loads its solver from /cdn-cgi/challenge-platform. Ordinary pages
+        # can carry its bot-detection script from the same path, so that one doesn't count. Classify in the browser so
+        # only a boolean crosses the wire.
         try:
-            page.wait_for_selector('input[name="user[email]"]', timeout=60000)
+            challenged = page.evaluate("""() => {
+                const html = document.documentElement.outerHTML.replaceAll('challenge-platform/scripts/jsd/', '');
+                return html.length < 200000 && (html.includes('challenge-platform') || html.includes('jschl_vc'));
+            }""")
+        except PlaywrightError:
+            # The page navigated away mid-check, which only happens while the challenge resolves itself
+            challenged = True
+
+        # Without a challenge the form is already there; otherwise give Cloudflare time to verify and redirect
+        logger.info("Waiting for login form...")
+        timeout = 10000.0
+        if challenged:
+            logger.info("Cloudflare challenge detected, waiting for it to clear...")
+            deadline = time.monotonic() + _CHALLENGE_TIMEOUT_MS / 1000
+            try:
+                page.wait_for_load_state("networkidle", timeout=_CHALLENGE_TIMEOUT_MS)
+            except PlaywrightTimeoutError:
+                # A page that keeps polling never goes idle, but the form may well be there
+                logger.info("Page didn't go idle, looking for the login form anyway")
+            # Share one budget between both waits; Playwright treats a timeout of 0 as no timeout
+            timeout = max(1.0, (deadline - time.monotonic()) * 1000)
+        try:
+            page.wait_for_selector('input[name="user[email]"]', timeout=timeout)
         except Exception as e:
-            # Log page state for debugging
-            logger.exception(f"Login form not found. Page title: {page.title()}")
-            logger.info(f"Page URL: {page.url}")
-            logger.info(f"Page content preview: {page.content()[:2000]}")
-            browser.close()
-            playwright.stop()
+            logger.exception("Login form not found")
+            if logger.isEnabledFor(logging.DEBUG):
+                # Slice in the browser so a large page isn't serialized over CDP just to be truncated here
+                logger.debug(
+                    "Page title: %s, URL: %s, content preview: %s",
+                    page.title(),
+                    page.url,
+                    page.evaluate("() => document.documentElement.outerHTML.slice(0, 2000)"),
+                )
             raise RuntimeError("Could not load login page - Cloudflare may be blocking") from e
 
-        # Fill in login form
+        # Fill in and submit the login form in a single round-trip to the browser. The click is deferred so this
+        # returns before the navigation it triggers tears down the page's execution context.
         logger.info("Filling login form...")
-        page.fill('input[name="user[email]"]', username)
-        page.fill('input[name="user[password]"]', password)
-        page.click('input[type="submit"]')
+        page.evaluate(
+            """([username, password]) => {
+            for (const [name, value] of [['user[email]', username], ['user[password]', password]]) {
+                const input = document.querySelector(`input[name="${name}"]`);
+                input.value = value;
+                input.dispatchEvent(new Event('input', {bubbles: true}));
+            }
+            const submit = document.querySelector('input[type="submit"]');
+            setTimeout(() => submit.click());
+        }""",
+            [username, password],
+        )
 
-        # Wait for navigation after login (URL should change away from sign_in)
-        page.wait_for_url(lambda url: "sign_in" not in url, timeout=30000)
+        # A successful login navigates away from sign_in; a rejected one re-renders the form in place
+        try:
+            page.wait_for_url(lambda url: "sign_in" not in url, timeout=30000)
+        except PlaywrightTimeoutError as e:
+            raise RuntimeError("Login failed") from e
 
-        # Check for login failure
-        if "sign_in" in page.url or "Incorrect" in page.content():
-            browser.close()
-            playwright.stop()
-            raise RuntimeError("Login failed")
-
-        logger.info("Login successful")
-        return PlayByPointClient(playwright, browser, context, page)
+        csrf_token = page.locator('meta[name="csrf-token"]').get_attribute("content")
+        if not csrf_token:
+            raise RuntimeError("Couldn't find CSRF token after login")
+        return csrf_token
 
     def close(self) -> None:
-        """Close the browser and clean up resources."""
-        self._browser.close()
-        self._playwright.stop()
+        """Close the HTTP session and clean up resources."""
+        self._evict()
+        self._session.close()
+        for session in self._retired_sessions:
+            session.close()
+
+    def _evict(self) -> None:
+        """Stop handing this client out from the pool, e.g. because its session was rejected."""
+        with _pool_lock:
+            for username, (client, _, _) in list(_pool.items()):
+                if client is self:
+                    del _pool[username]
+
+    def _check_status(self, status: int, url: str) -> None:
+        if status in (401, 403):
+            self._evict()
+        if status != 200:
+            raise RuntimeError(f"API request failed with status {status}: {url}")
+
+    def _send(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        session = self._session
+        response = session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+        # Only a browser can solve the challenge, so retrying with these cookies won't help; sign in again for fresh
+        # clearance and retry once
+        if _is_cloudflare_challenge(response) and self._relogin(session):
+            response = self._session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+        if _is_cloudflare_challenge(response):
+            self._evict()
+            raise RuntimeError(f"API request was challenged by Cloudflare: {url}")
+        return response
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """
+        Sends a request, retrying connection errors, timeouts, 429 and 5xx with jittered exponential backoff.
+
+        Raises:
+            RuntimeError: If the last attempt can't connect or times out, or Cloudflare still challenges the request
+                after signing in again.
+        """
+        for attempt in range(_MAX_ATTEMPTS - 1):
+            response = None
+            try:
+                response = self._send(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                logger.warning("%s %s failed, retrying", method, url, exc_info=True)
+            else:
+                if response.status_code not in _RETRY_STATUSES:
+                    return response
+                logger.warning("%s %s returned %d, retrying", method, url, response.status_code)
+            time.sleep(_backoff_delay(attempt, response))
+        try:
+            return self._send(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RuntimeError(f"API request failed after {_MAX_ATTEMPTS} attempts: {url}") from e
+
+    def _relogin(self, stale_session: requests.Session) -> bool:
+        """
+        Signs in again to replace a session the server rejected, unless a concurrent request already has.
+
+        Returns:
+            bool: True if the client now uses a session other than stale_session.
+        """
+        with self._relogin_lock:
+            if self._session is not stale_session:
+                return True
+            if self._credentials is None:
+                return False
+            username, password = self._credentials
+            logger.info("Playbypoint session was rejected, signing in again...")
+            try:
+                fresh = PlayByPointClient.from_login(username=username, password=password)
+            except Exception:
+                # Don't make every waiting request try again; they fail with their own response instead
+                logger.exception("Failed to sign in to Playbypoint again")
+                self._credentials = None
+                return False
+            self._retired_sessions.append(self._session)
+            self._session = fresh._session
+            return True
+
+    def _api_request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """
+        Sends a request with _request, recovering once from a rejected CSRF token or session.
+
+        A rejected CSRF token is refreshed first. If the session itself is rejected, the client signs in again.
+        """
+        session = self._session
+        csrf_token = session.headers.get("X-CSRF-Token")
+        response = self._request(method, url, **kwargs)
+        # The token is only read at sign-in, so fetch a new one if it has expired and retry once
+        if method != "GET" and response.status_code in _CSRF_REJECTED_STATUSES and self._refresh_csrf(csrf_token):
+            response = self._request(method, url, **kwargs)
+        if response.status_code in (401, 403) and self._relogin(session):
+            response = self._request(method, url, **kwargs)
+        return response
 
     def _api_get(self, url: str) -> Any:
-        """Make a GET request using the browser context."""
-        result = self._page.evaluate(
-            """async (url) => {
-            const resp = await fetch(url);
-            return {status: resp.status, body: await resp.text()};
-        }""",
-            url,
-        )
-        if result["status"] != 200:
-            raise RuntimeError(f"API request failed with status {result['status']}: {url}")
-        return json.loads(result["body"])
-
-    def _api_put(self, url: str, data: dict[str, Any]) -> Any:
-        """Make a PUT request using the browser context."""
-        # Get CSRF token from meta tag
-        csrf_token = self._page.locator('meta[name="csrf-token"]').get_attribute("content")
-
-        result = self._page.evaluate(
-            """async ({url, data, csrfToken}) => {
-            const formData = new URLSearchParams();
-            for (const [key, value] of Object.entries(data)) {
-                formData.append(key, value);
-            }
-            const resp = await fetch(url, {
-                method: 'PUT',
-                headers: {
-                    'Content-Type': 'application/x-www-form-urlencoded',
-                    'X-CSRF-Token': csrfToken,
-                },
-                body: formData.toString(),
-            });
-            return {status: resp.status, body: await resp.text()};
-        }""",
-            {"url": url, "data": data, "csrfToken": csrf_token},
-        )
-        if result["status"] != 200:
-            raise RuntimeError(f"API request failed with status {result['status']}: {url}")
-        return json.loads(result["body"]) if result["body"] else None
+        response = self._api_request("GET", url)
+        self._check_status(response.status_code, url)
+        return orjson.loads(response.content)
 
-    def update_entry_codes(self, *, owner_id: str, codes: Mapping[str, str | None]) -> None:
+    def _refresh_csrf(self, stale_token: str | bytes | None) -> bool:
         """
-        Updates the Playbypoint facility settings with the provided daily codes.
+        Replaces a CSRF token the server rejected, unless a concurrent request already has.
 
-        Providing None as the code value will clear the code for that day.
-        Omitting a key results in no change.
+        Returns:
+            bool: True if the session now carries a token other than stale_token.
+        """
+        with self._csrf_lock:
+            if self._session.headers.get("X-CSRF-Token") != stale_token:
+                return True
+            try:
+                csrf_token = self._fetch_csrf_token(self._session)
+            except requests.RequestException:
+                logger.warning("Failed to refresh Playbypoint CSRF token", exc_info=True)
+                return False
+            if csrf_token is None:
+                return False
+            self._session.headers["X-CSRF-Token"] = csrf_token
+            logger.info("Refreshed Playbypoint CSRF token")
+            return True
+
+    def _api_put(self, url: str, data: list[tuple[str, Any]]) -> Any:
+        # Encode once up front rather than on every retry; requests drops None values, so do the same
+        body = urlencode([(key, value) for key, value in data if value is not None])
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        response = self._api_request("PUT", url, data=body, headers=headers)
+        self._check_status(response.status_code, url)
+        return orjson.loads(response.content) if response.content else None
+
+    def fetch_entry_codes(self, *, owner_id: str) -> EntryCodesResponse:
+        """
+        Fetches the current entry code settings for a facility.
 
         Args:
             owner_id (str): The ID of the owner.
-            codes (dict): A mapping of days of the month (1-31) to the new codes.
+
+        Returns:
+            EntryCodesResponse: The parsed entry code rule.
 
         Raises:
             RuntimeError: If the API request fails.
@@ -217,7 +618,91 @@ class PlayByPointClient:
         rules_payload = self._api_get(
             f"https://app.playbypoint.com/api/rules?owner={owner_id}&namespace=facility_rules"
         )
-        entry_codes = _parse_entry_codes(rules_payload)
+        return _parse_entry_codes(rules_payload)
+
+    def update_entry_codes(
+        self,
+        *,
+        owner_id: str,
+        codes: Mapping[str, str | None],
+        entry_codes: EntryCodesResponse | None = None,
+    ) -> None:
+        """
+        Updates the Playbypoint facility settings with the provided daily codes.
+
+        Providing None as the code value will clear the code for that day.
+        Omitting a key results in no change. No request is made if the codes already match.
+
+        Args:
+            owner_id (str): The ID of the owner.
+            codes (dict): A mapping of days of the month (1-31) to the new codes.
+            entry_codes (EntryCodesResponse | None): The current settings from fetch_entry_codes, if already
+                fetched. Fetched on demand otherwise.
+
+        Raises:
+            RuntimeError: If the API request fails.
+        """
+        if entry_codes is None:
+            entry_codes = self.fetch_entry_codes(owner_id=owner_id)
+
+        if not _has_changes(entry_codes=entry_codes, updated_codes=codes):
+            logger.info("Entry codes are already up to date, skipping update")
+            return
 
         update_payload = _build_update_payload(owner_id=owner_id, entry_codes=entry_codes, updated_codes=codes)
-        self._api_put(f"https://app.playbypoint.com/api/rules/{entry_codes['rule_id']}", update_payload)
+        self._api_put(f"https://app.playbypoint.com/api/rules/{entry_codes.rule_id}", update_payload)
+
+    def update_entry_codes_many(self, updates: Mapping[str, Mapping[str, str | None]]) -> None:
+        """
+        Updates the entry codes of several facilities, overlapping their requests.
+
+        All facilities' rules are fetched concurrently and each update is sent as soon as its rules come in, so the
+        total latency is about that of a single update_entry_codes call. A failure for one facility doesn't stop the
+        others from being updated.
+
+        Args:
+            updates (dict): A mapping of owner IDs to codes, as accepted by update_entry_codes.
+
+        Raises:
+            RuntimeError: If any facility couldn't be updated, once all the others have been.
+        """
+        failures: dict[str, Exception] = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(len(updates), _MAX_CONCURRENT_REQUESTS))) as executor:
+            fetches = {executor.submit(self.fetch_entry_codes, owner_id=owner_id): owner_id for owner_id in updates}
+            puts: dict[Future[None], str] = {}
+            for fetch in as_completed(fetches):
+                owner_id = fetches[fetch]
+                try:
+                    entry_codes = fetch.result()
+                except Exception as e:
+                    failures[owner_id] = e
+                    continue
+                put = executor.submit(
+                    self.update_entry_codes, owner_id=owner_id, codes=updates[owner_id], entry_codes=entry_codes
+                )
+                puts[put] = owner_id
+            for put in as_completed(puts):
+                try:
+                    put.result()
+                except Exception as e:
+                    failures[puts[put]] = e
+
+        if failures:
+            for owner_id, error in failures.items():
+                logger.error("Failed to update entry codes for owner %s", owner_id, exc_info=error)
+            raise RuntimeError(
+                f"Failed to update entry codes for {len(failures)} of {len(updates)} owners: {', '.join(failures)}"
+            ) from next(iter(failures.values()))
+
+
+def close_all() -> None:
+    """Closes every pooled client and the shared login browser."""
+    with _pool_lock:
+        clients = [client for client, _, _ in _pool.values()]
+    for client in clients:
+        client.close()
+    if _browser_thread is not None:
+        _run_on_browser_thread(_close_browser)
+
+
+atexit.register(close_all)
@@ -0,0 +1,4 @@
+# (connect, read) in seconds, for every HTTP request
+REQUEST_TIMEOUT = (3.05, 10)
+# Cap in seconds on exponential backoff between retries and on how much of a server's Retry-After is honoured
+MAX_RETRY_WAIT = 8
@@ -0,0 +1,31 @@
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import orjson
+import pytest
+import requests
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Points the on-disk cache at a per-test directory, so tests never see each other's tokens or sessions."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def make_response() -> Callable[..., requests.Response]:
+    """Builds canned responses; bodies other than bytes are encoded as JSON."""
+
+    def make_response(
+        status: int, body: Any = None, headers: dict[str, str] | None = None, url: str = "https://example.com/"
+    ) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response._content = body if isinstance(body, bytes) else orjson.dumps(body) if body is not None else b""
+        response.headers.update(headers or {})
+        response.url = url
+        return response
+
+    return make_response
@@ -0,0 +1,147 @@
+import sys
+import threading
+from datetime import date, datetime, timedelta, tzinfo
+from typing import Any
+from unittest import mock
+
+import pytest
+
+from lock_automation import generate_codes_cli
+from lock_automation.generate_codes_cli import days_missing_codes, main
+from lock_automation.play_by_point import EntryCodesResponse, ExistingEntryCode
+
+DAYS = [date(2025, 1, 10) + timedelta(days=i) for i in range(4)]  # 10th to 13th
+
+
+def _entry_codes(existing: dict[int, str]) -> EntryCodesResponse:
+    """A rule with a variant for every day of the month (variant ID = 100 + day) and codes on the given days."""
+    return EntryCodesResponse(
+        rule_id=1,
+        variant_id=2,
+        day_ids={str(day): 100 + day for day in range(1, 32)},
+        existing_values={100 + day: ExistingEntryCode(id=day, value=value) for day, value in existing.items()},
+    )
+
+
+def test_days_without_a_code_are_kept() -> None:
+    assert days_missing_codes(DAYS, _entry_codes({10: "1111", 12: "3333"})) == [DAYS[1], DAYS[3]]
+
+
+def test_days_with_an_empty_code_are_kept() -> None:
+    assert days_missing_codes(DAYS, _entry_codes({10: "", 11: "2222", 12: "3333"})) == [DAYS[0], DAYS[3]]
+
+
+def test_last_day_is_kept_even_with_a_code() -> None:
+    # The code on the last day was generated a month ago for the same day of the month, so it is stale
+    assert days_missing_codes(DAYS, _entry_codes({10: "1111", 11: "2222", 12: "3333", 13: "4444"})) == [DAYS[3]]
+
+
+def test_days_the_rule_does_not_have_are_kept() -> None:
+    entry_codes = _entry_codes({10: "1111", 11: "2222", 12: "3333"})
+    del entry_codes.day_ids["11"]
+    assert days_missing_codes(DAYS, entry_codes) == [DAYS[1], DAYS[3]]
+
+
+def test_empty_window() -> None:
+    assert days_missing_codes([], _entry_codes({10: "1111"})) == []
+
+
+class FrozenDatetime(datetime):
+    """Pins "today" to the 9th, so the CLI's window is the 10th to the 12th."""
+
+    @classmethod
+    def now(cls, tz: tzinfo | None = None) -> "FrozenDatetime":
+        return cls(2025, 1, 9, 12, tzinfo=tz)
+
+
+class FakeServices:
+    """Records the order of Igloo and Playbypoint calls made by main, failing PINs for the days in failing_days."""
+
+    def __init__(self, existing: dict[int, str], failing_days: set[int]) -> None:
+        self.events: list[str] = []
+        self._lock = threading.Lock()
+        self._entry_codes = _entry_codes(existing)
+        self._failing_days = failing_days
+        self.igloo = mock.Mock()
+        self.igloo.create_daily_pin.side_effect = self._create_daily_pin
+        self.play_by_point = mock.Mock()
+        self.play_by_point.fetch_entry_codes.side_effect = self._fetch_entry_codes
+
+    def _record(self, event: str) -> None:
+        with self._lock:
+            self.events.append(event)
+
+    def _create_daily_pin(self, *, start_date: datetime, **kwargs: Any) -> dict[str, str]:
+        self._record(f"pin {start_date.day}")
+        if start_date.day in self._failing_days:
+            raise RuntimeError("Igloo is down")
+        return {"pin": f"pin{start_date.day}", "pinId": str(start_date.day)}
+
+    def _fetch_entry_codes(self, *, owner_id: str) -> EntryCodesResponse:
+        self._record("fetch")
+        return self._entry_codes
+
+    def updated_codes(self) -> dict[str, str | None]:
+        self.play_by_point.update_entry_codes.assert_called_once()
+        codes: dict[str, str | None] = self.play_by_point.update_entry_codes.call_args.kwargs["codes"]
+        return codes
+
+
+def _run_main(services: FakeServices, *extra_args: str, login_error: Exception | None = None) -> None:
+    argv = [
+        "generate-codes",
+        *("--igloo-client-id", "id", "--igloo-client-secret", "secret", "--igloo-lock-id", "lock"),
+        *("--play-by-point-username", "user", "--play-by-point-password", "pw", "--play-by-point-owner", "42"),
+        *("--timezone", "America/Denver", "--num-days", "3"),
+        *extra_args,
+    ]
+    with (
+        mock.patch.object(sys, "argv", argv),
+        mock.patch.object(generate_codes_cli, "datetime", FrozenDatetime),
+        mock.patch.object(generate_codes_cli.IglooClient, "from_client_credentials", return_value=services.igloo),
+        mock.patch.object(
+            generate_codes_cli.PlayByPointClient,
+            "get_or_login",
+            return_value=services.play_by_point,
+            side_effect=login_error,
+        ),
+    ):
+        main()
+
+
+@pytest.fixture
+def services() -> FakeServices:
+    return FakeServices(existing={10: "old10", 11: "old11", 12: "old12"}, failing_days={11})
+
+
+def test_main_generates_every_day_and_leaves_out_failures(services: FakeServices) -> None:
+    _run_main(services)
+
+    assert sorted(event for event in services.events if event.startswith("pin")) == ["pin 10", "pin 11", "pin 12"]
+    assert services.updated_codes() == {"10": "pin10", "12": "pin12"}
+
+
+def test_main_reuse_mode_fetches_rules_before_generating_pins() -> None:
+    services = FakeServices(existing={10: "old10"}, failing_days=set())
+    _run_main(services, "--reuse-existing-codes")
+
+    # The 10th already has a code, so only the 11th and the always-regenerated last day get pins
+    assert services.events[0] == "fetch"
+    assert sorted(services.events[1:]) == ["pin 11", "pin 12"]
+    assert services.updated_codes() == {"11": "pin11", "12": "pin12"}
+
+
+def test_main_exits_when_login_fails(services: FakeServices) -> None:
+    with pytest.raises(SystemExit) as excinfo:
+        _run_main(services, login_error=RuntimeError("Cloudflare says no"))
+
+    assert excinfo.value.code == 1
+    services.play_by_point.update_entry_codes.assert_not_called()
+
+
+def test_main_reuse_mode_clears_stale_codes_for_failed_days() -> None:
+    services = FakeServices(existing={10: "old10", 11: "old11", 12: "old12"}, failing_days={12})
+    _run_main(services, "--reuse-existing-codes")
+
+    # Leaving the 12th out would preserve last month's code, and later runs would skip the day for having one
+    assert services.updated_codes() == {"12": None}
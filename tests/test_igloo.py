@@ -0,0 +1,106 @@
+from collections.abc import Callable, Iterator
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import pytest
+import requests
+from urllib3 import HTTPResponse, Retry
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError, ReadTimeoutError
+
+from lock_automation.igloo import IglooClient
+
+TOKEN_URL = "https://auth.igloohome.co/oauth2/token"
+
+
+class FakeIgloo:
+    """Stands in for both Igloo endpoints; the PIN endpoint only accepts the tokens in valid_tokens."""
+
+    def __init__(self, make_response: Callable[..., requests.Response]) -> None:
+        self._make_response = make_response
+        self.minted = 0
+        self.valid_tokens: set[str] = set()
+        self.calls: list[tuple[str, str | None]] = []
+
+    def post(self, session: requests.Session, url: str, **kwargs: Any) -> requests.Response:
+        authorization = session.headers.get("Authorization")
+        self.calls.append((url, authorization if isinstance(authorization, str) else None))
+        if url == TOKEN_URL:
+            self.minted += 1
+            token = f"token-{self.minted}"
+            self.valid_tokens.add(token)
+            return self._make_response(200, {"access_token": token, "expires_in": 3600})
+        if authorization not in {f"Bearer {token}" for token in self.valid_tokens}:
+            return self._make_response(401, {"message": "Unauthorized"})
+        return self._make_response(200, {"pin": "123456", "pinId": "1"})
+
+
+@pytest.fixture
+def igloo(make_response: Callable[..., requests.Response]) -> Iterator[FakeIgloo]:
+    fake = FakeIgloo(make_response)
+    with mock.patch.object(requests.Session, "post", autospec=True, side_effect=fake.post):
+        yield fake
+
+
+def _create_pin(client: IglooClient) -> str:
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return client.create_daily_pin(lock_id="lock", start_date=start, end_date=start, access_name="Pin")["pin"]
+
+
+def test_cached_token_is_reused(igloo: FakeIgloo) -> None:
+    IglooClient.from_client_credentials(client_id="id", client_secret="secret")
+    client = IglooClient.from_client_credentials(client_id="id", client_secret="secret")
+
+    assert _create_pin(client) == "123456"
+    assert igloo.minted == 1
+
+
+def test_cached_token_is_not_reused_with_a_different_secret(igloo: FakeIgloo, cache_home: Path) -> None:
+    IglooClient.from_client_credentials(client_id="id", client_secret="old-secret")
+    IglooClient.from_client_credentials(client_id="id", client_secret="new-secret")
+
+    assert igloo.minted == 2
+    assert b"secret" not in (cache_home / "lock_automation" / "igloo_token.json").read_bytes()
+
+
+def test_rejected_token_is_replaced_once(igloo: FakeIgloo) -> None:
+    client = IglooClient.from_client_credentials(client_id="id", client_secret="secret")
+    igloo.valid_tokens.clear()
+
+    assert _create_pin(client) == "123456"
+    assert igloo.minted == 2
+    # The new token is cached, so the next run doesn't start with the revoked one
+    assert _create_pin(IglooClient.from_client_credentials(client_id="id", client_secret="secret")) == "123456"
+    assert igloo.minted == 2
+
+
+def test_rejected_token_without_credentials_raises(igloo: FakeIgloo) -> None:
+    with pytest.raises(requests.HTTPError):
+        _create_pin(IglooClient("revoked"))
+    assert igloo.minted == 0
+
+
+def test_api_requests_are_only_retried_when_they_were_not_processed() -> None:
+    client = IglooClient("token")
+    retry = client._session.get_adapter("https://api.igloodeveloper.co").max_retries
+
+    assert retry.is_retry("POST", 429)
+    assert retry.is_retry("POST", 503)
+    for status in (500, 502, 504):
+        assert not retry.is_retry("POST", status)
+    assert retry.increment("POST", "/", error=ConnectTimeoutError()).connect == 3
+    with pytest.raises(MaxRetryError):
+        retry.increment("POST", "/", error=ReadTimeoutError(None, "/", "read timed out"))
+
+
+@pytest.mark.parametrize("retry", [IglooClient._API_RETRY, IglooClient._TOKEN_RETRY], ids=["api", "token"])
+def test_retry_waits_are_capped(retry: Retry) -> None:
+    assert retry.get_retry_after(HTTPResponse(status=429, headers={"Retry-After": "3600"})) == 8
+    assert retry.get_retry_after(HTTPResponse(status=429, headers={"Retry-After": "2"})) == 2
+    assert retry.get_retry_after(HTTPResponse(status=429)) is None
+    # Exponential backoff stops growing at the same cap
+    for _ in range(3):
+        retry = retry.increment("POST", "/", error=ConnectTimeoutError())
+    retry.backoff_factor = 100
+    assert retry.get_backoff_time() == 8
@@ -0,0 +1,566 @@
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from unittest import mock
+from urllib.parse import urlencode
+
+import pytest
+import requests
+from playwright.sync_api import Page
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+from lock_automation import cache, play_by_point
+from lock_automation.play_by_point import (
+    EntryCodesResponse,
+    PlayByPointClient,
+    _backoff_delay,
+    _build_update_payload,
+    _has_changes,
+    _parse_entry_codes,
+)
+
+RULES_URL = "https://app.playbypoint.com/api/rules/77"
+# Rules as returned by the API: days 1-5 of the month, with codes on days 1-3
+RULES_PAYLOAD: list[dict[str, Any]] = [
+    {"display_name": "Other", "id": 1},
+    {
+        "display_name": "Entry Access Codes",
+        "id": 77,
+        "variants": [
+            {"display_name": "Court", "id": 3, "values": []},
+            {
+                "display_name": "Day",
+                "id": 9,
+                "values": [{"text": str(day), "value": 1000 + day} for day in range(1, 6)],
+            },
+        ],
+        "values": [
+            {"id": 500 + day, "value": f"old{day}", "variants": [{"rule_variant_item_id": 1000 + day}]}
+            for day in (1, 2, 3)
+        ],
+    },
+]
+UPDATED_CODES = {"1": "new1", "2": None, "4": "new4", "32": "ignored"}
+# What the original dict-based payload builder produced for UPDATED_CODES: day 1 is updated, day 2 is cleared by
+# omission, day 3 is preserved, day 4 is created and day 5 is left alone
+GOLDEN_PAYLOAD = {
+    "rule[id]": 77,
+    "owner": "42",
+    "rule[values_attributes][0][id]": 501,
+    "rule[values_attributes][0][rule_id]": 77,
+    "rule[values_attributes][0][value]": "new1",
+    "rule[values_attributes][0][value_variants_attributes][0][variant_rule_id]": 9,
+    "rule[values_attributes][0][value_variants_attributes][0][rule_variant_item_id]": "1001",
+    "rule[values_attributes][2][id]": 503,
+    "rule[values_attributes][2][rule_id]": 77,
+    "rule[values_attributes][2][value]": "old3",
+    "rule[values_attributes][2][value_variants_attributes][0][variant_rule_id]": 9,
+    "rule[values_attributes][2][value_variants_attributes][0][rule_variant_item_id]": "1003",
+    "rule[values_attributes][3][rule_id]": 77,
+    "rule[values_attributes][3][value]": "new4",
+    "rule[values_attributes][3][value_variants_attributes][0][variant_rule_id]": 9,
+    "rule[values_attributes][3][value_variants_attributes][0][rule_variant_item_id]": "1004",
+}
+
+
+ResponseFactory = Callable[..., requests.Response]
+DASHBOARD_URL = "https://app.playbypoint.com/dashboard"
+
+
+@pytest.fixture
+def entry_codes() -> EntryCodesResponse:
+    return _parse_entry_codes(RULES_PAYLOAD)
+
+
+@pytest.fixture
+def client() -> Iterator[PlayByPointClient]:
+    session = requests.Session()
+    session.headers["X-CSRF-Token"] = "token"
+    client = PlayByPointClient(session)
+    yield client
+    client.close()
+
+
+def test_parse_entry_codes(entry_codes: EntryCodesResponse) -> None:
+    assert entry_codes.rule_id == 77
+    assert entry_codes.variant_id == 9
+    assert entry_codes.day_ids == {str(day): 1000 + day for day in range(1, 6)}
+    assert {variant_id: (e.id, e.value) for variant_id, e in entry_codes.existing_values.items()} == {
+        1001: (501, "old1"),
+        1002: (502, "old2"),
+        1003: (503, "old3"),
+    }
+
+
+@pytest.mark.parametrize(
+    ("codes", "expected"),
+    [
+        ({}, False),
+        ({"1": "old1", "2": "old2"}, False),
+        ({"1": "new1"}, True),
+        # Clearing a day that has a code is a change; clearing one that doesn't isn't
+        ({"1": None}, True),
+        ({"4": None}, False),
+        # An empty code is written as a value, so it differs from having none
+        ({"4": ""}, True),
+        # Days the rule doesn't have are never written
+        ({"32": "new32"}, False),
+    ],
+)
+def test_has_changes(entry_codes: EntryCodesResponse, codes: dict[str, str | None], expected: bool) -> None:
+    assert _has_changes(entry_codes=entry_codes, updated_codes=codes) is expected
+
+
+def test_has_changes_treats_an_empty_code_as_distinct_from_none() -> None:
+    entry_codes = _parse_entry_codes(RULES_PAYLOAD)
+    entry_codes.existing_values[1001].value = ""
+    assert _has_changes(entry_codes=entry_codes, updated_codes={"1": ""}) is False
+    assert _has_changes(entry_codes=entry_codes, updated_codes={"1": None}) is True
+
+
+def test_build_update_payload_matches_golden(entry_codes: EntryCodesResponse) -> None:
+    payload = _build_update_payload(owner_id="42", entry_codes=entry_codes, updated_codes=UPDATED_CODES)
+    assert urlencode(payload) == urlencode(GOLDEN_PAYLOAD)
+
+
+def test_update_entry_codes_sends_golden_body(
+    client: PlayByPointClient, entry_codes: EntryCodesResponse, make_response: ResponseFactory
+) -> None:
+    with mock.patch.object(client, "_send", return_value=make_response(200, {})) as send:
+        client.update_entry_codes(owner_id="42", codes=UPDATED_CODES, entry_codes=entry_codes)
+
+    send.assert_called_once_with(
+        "PUT",
+        RULES_URL,
+        data=urlencode(GOLDEN_PAYLOAD),
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+
+
+def test_update_entry_codes_skips_unchanged(client: PlayByPointClient, entry_codes: EntryCodesResponse) -> None:
+    with mock.patch.object(client, "_send") as send:
+        client.update_entry_codes(owner_id="42", codes={"1": "old1"}, entry_codes=entry_codes)
+    send.assert_not_called()
+
+
+def test_get_or_login_reuses_pooled_client(client: PlayByPointClient) -> None:
+    with mock.patch.object(PlayByPointClient, "from_cached_session", return_value=client) as from_cached_session:
+        assert PlayByPointClient.get_or_login(username="user", password="pw") is client
+        assert PlayByPointClient.get_or_login(username="user", password="pw") is client
+    from_cached_session.assert_called_once()
+
+
+def test_concurrent_rejections_evict_once(client: PlayByPointClient) -> None:
+    play_by_point._pool["user"] = (client, 0.0, 1)
+
+    def reject() -> None:
+        with pytest.raises(RuntimeError, match="status 401"):
+            client._check_status(401, RULES_URL)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for future in [executor.submit(reject) for _ in range(32)]:
+            future.result()
+    assert "user" not in play_by_point._pool
+
+
+@pytest.fixture
+def cached_session() -> str:
+    cache_file = PlayByPointClient._session_cache_file("user")
+    cache.write_json(cache_file, {"cookies": [{"name": "session", "value": "abc", "domain": "app.playbypoint.com"}]})
+    return cache_file
+
+
+def test_from_cached_session_restores_a_signed_in_session(
+    cached_session: str, signed_in_page: requests.Response
+) -> None:
+    with mock.patch.object(requests.Session, "get", return_value=signed_in_page):
+        client = PlayByPointClient.from_cached_session(username="user")
+
+    assert client is not None
+    assert client._session.headers["X-CSRF-Token"] == "fresh"
+    assert client._session.cookies["session"] == "abc"
+    client.close()
+
+
+def test_from_cached_session_drops_a_signed_out_session(cached_session: str, make_response: ResponseFactory) -> None:
+    with mock.patch.object(
+        requests.Session, "get", return_value=make_response(200, b"<form>", url=play_by_point._SIGN_IN_URL)
+    ):
+        assert PlayByPointClient.from_cached_session(username="user") is None
+    assert cache.read_json(cached_session) is None
+
+
+@pytest.mark.parametrize("failure", ["connection error", "server error"])
+def test_from_cached_session_keeps_the_cache_on_transient_failures(
+    cached_session: str, failure: str, make_response: ResponseFactory
+) -> None:
+    probe = (
+        requests.ConnectionError("network blip")
+        if failure == "connection error"
+        else make_response(503, url=play_by_point._SIGN_IN_URL)
+    )
+    with mock.patch.object(requests.Session, "get", side_effect=[probe]):
+        assert PlayByPointClient.from_cached_session(username="user") is None
+    assert cache.read_json(cached_session) is not None
+
+
+def test_update_entry_codes_many_updates_each_owner_as_its_rules_arrive(
+    client: PlayByPointClient, entry_codes: EntryCodesResponse
+) -> None:
+    fast_updated = threading.Event()
+
+    def fetch_entry_codes(*, owner_id: str) -> EntryCodesResponse:
+        # The slow owner's rules only arrive once the fast owner has been updated
+        if owner_id == "slow":
+            assert fast_updated.wait(timeout=5)
+        return entry_codes
+
+    def update_entry_codes(*, owner_id: str, codes: dict[str, str | None], entry_codes: EntryCodesResponse) -> None:
+        if owner_id == "fast":
+            fast_updated.set()
+
+    with (
+        mock.patch.object(client, "fetch_entry_codes", side_effect=fetch_entry_codes),
+        mock.patch.object(client, "update_entry_codes", side_effect=update_entry_codes) as update,
+    ):
+        client.update_entry_codes_many({"slow": {"1": "a"}, "fast": {"1": "b"}})
+
+    assert update.call_count == 2
+
+
+def test_update_entry_codes_many_reports_every_failure(
+    client: PlayByPointClient, entry_codes: EntryCodesResponse
+) -> None:
+    def fetch_entry_codes(*, owner_id: str) -> EntryCodesResponse:
+        if owner_id == "fetch-fails":
+            raise RuntimeError("fetch failed")
+        return entry_codes
+
+    def update_entry_codes(*, owner_id: str, codes: dict[str, str | None], entry_codes: EntryCodesResponse) -> None:
+        if owner_id == "put-fails":
+            raise RuntimeError("put failed")
+
+    with (
+        mock.patch.object(client, "fetch_entry_codes", side_effect=fetch_entry_codes),
+        mock.patch.object(client, "update_entry_codes", side_effect=update_entry_codes) as update,
+        pytest.raises(RuntimeError, match="2 of 3 owners") as excinfo,
+    ):
+        client.update_entry_codes_many({"fetch-fails": {}, "put-fails": {}, "ok": {}})
+
+    assert "fetch-fails" in str(excinfo.value)
+    assert "put-fails" in str(excinfo.value)
+    assert sorted(call.kwargs["owner_id"] for call in update.call_args_list) == ["ok", "put-fails"]
+
+
+@pytest.fixture
+def sleep() -> Iterator[mock.Mock]:
+    with mock.patch.object(play_by_point.time, "sleep") as sleep:
+        yield sleep
+
+
+def test_request_retries_transient_failures(
+    client: PlayByPointClient, sleep: mock.Mock, make_response: ResponseFactory
+) -> None:
+    responses = [
+        requests.ConnectionError("reset"),
+        make_response(503),
+        make_response(429),
+        make_response(200, {"ok": True}),
+    ]
+    with mock.patch.object(client._session, "request", side_effect=responses) as request:
+        assert client._api_get(RULES_URL) == {"ok": True}
+
+    assert request.call_count == 4
+    assert sleep.call_count == 3
+
+
+def test_request_does_not_retry_client_errors(
+    client: PlayByPointClient, sleep: mock.Mock, make_response: ResponseFactory
+) -> None:
+    with (
+        mock.patch.object(client._session, "request", return_value=make_response(404)) as request,
+        pytest.raises(RuntimeError, match="status 404"),
+    ):
+        client._api_get(RULES_URL)
+
+    request.assert_called_once()
+    sleep.assert_not_called()
+
+
+def test_request_wraps_the_last_connection_error(client: PlayByPointClient, sleep: mock.Mock) -> None:
+    with (
+        mock.patch.object(client._session, "request", side_effect=requests.ConnectionError("down")) as request,
+        pytest.raises(RuntimeError, match="failed after 5 attempts") as excinfo,
+    ):
+        client._api_get(RULES_URL)
+
+    assert request.call_count == play_by_point._MAX_ATTEMPTS
+    assert isinstance(excinfo.value.__cause__, requests.ConnectionError)
+
+
+CHALLENGE_BODY = b"<script src='/cdn-cgi/challenge-platform/h/b/orchestrate'>"
+
+
+def test_cloudflare_challenge_without_credentials_evicts_without_retrying(
+    client: PlayByPointClient, sleep: mock.Mock, make_response: ResponseFactory
+) -> None:
+    play_by_point._pool["user"] = (client, 0.0, 1)
+    challenge = make_response(403, CHALLENGE_BODY, {"Server": "cloudflare"})
+    with (
+        mock.patch.object(client._session, "request", return_value=challenge) as request,
+        pytest.raises(RuntimeError, match="challenged by Cloudflare"),
+    ):
+        client._api_get(RULES_URL)
+
+    request.assert_called_once()
+    assert "user" not in play_by_point._pool
+
+
+def test_cloudflare_challenge_signs_in_again_and_retries_once(
+    client: PlayByPointClient, sleep: mock.Mock, make_response: ResponseFactory
+) -> None:
+    fresh = requests.Session()
+    client._credentials = ("user", "pw")
+    play_by_point._pool["user"] = (client, 0.0, 1)
+    challenge = make_response(403, CHALLENGE_BODY, {"Server": "cloudflare"})
+    with (
+        mock.patch.object(client._session, "request", return_value=challenge),
+        mock.patch.object(fresh, "request", return_value=make_response(200, {})) as request,
+        mock.patch.object(PlayByPointClient, "from_login", return_value=PlayByPointClient(fresh)) as from_login,
+    ):
+        assert client._api_get(RULES_URL) == {}
+
+    from_login.assert_called_once_with(username="user", password="pw")
+    request.assert_called_once()
+    sleep.assert_not_called()
+    assert play_by_point._pool["user"][0] is client
+
+
+def test_cloudflare_challenge_after_signing_in_again_evicts(
+    client: PlayByPointClient, sleep: mock.Mock, make_response: ResponseFactory
+) -> None:
+    fresh = requests.Session()
+    client._credentials = ("user", "pw")
+    play_by_point._pool["user"] = (client, 0.0, 1)
+    challenge = make_response(403, CHALLENGE_BODY, {"Server": "cloudflare"})
+    with (
+        mock.patch.object(requests.Session, "request", return_value=challenge),
+        mock.patch.object(PlayByPointClient, "from_login", return_value=PlayByPointClient(fresh)) as from_login,
+        pytest.raises(RuntimeError, match="challenged by Cloudflare"),
+    ):
+        client._api_get(RULES_URL)
+
+    from_login.assert_called_once()
+    assert "user" not in play_by_point._pool
+
+
+@pytest.mark.parametrize(
+    ("attempt", "retry_after", "minimum", "maximum"),
+    [
+        (0, None, 0.25, 0.75),
+        (3, None, 2, 6),
+        # Exponential growth is capped
+        (10, None, 4, 12),
+        # Retry-After raises the delay, but never past the cap
+        (0, "3", 3, 3),
+        (0, "3600", 8, 8),
+        (0, "Wed, 21 Oct 2015 07:28:00 GMT", 0.25, 0.75),
+    ],
+)
+def test_backoff_delay(
+    attempt: int, retry_after: str | None, minimum: float, maximum: float, make_response: ResponseFactory
+) -> None:
+    response = make_response(429, headers={"Retry-After": retry_after} if retry_after is not None else None)
+    for jitter in (0.0, 0.5, 0.999):
+        with mock.patch.object(play_by_point.random, "random", return_value=jitter):
+            assert minimum <= _backoff_delay(attempt, response) <= maximum
+
+
+def _login_page(*, challenged: bool) -> mock.Mock:
+    page = mock.create_autospec(Page, instance=True)
+    # Classifying the page, then filling in the form
+    page.evaluate.side_effect = [challenged, None]
+    page.locator.return_value.get_attribute.return_value = "token"
+    return page
+
+
+def test_sign_in_without_challenge() -> None:
+    page = _login_page(challenged=False)
+    assert PlayByPointClient._sign_in(page, username="user", password="pw") == "token"
+
+    page.wait_for_load_state.assert_not_called()
+    page.wait_for_selector.assert_called_once_with('input[name="user[email]"]', timeout=10000)
+
+
+def test_sign_in_looks_for_the_form_when_a_challenged_page_never_goes_idle() -> None:
+    page = _login_page(challenged=True)
+    page.wait_for_load_state.side_effect = PlaywrightTimeoutError("networkidle timed out")
+    # The idle wait used up 59.5s of the budget
+    with mock.patch.object(play_by_point.time, "monotonic", side_effect=[100.0, 159.5]):
+        assert PlayByPointClient._sign_in(page, username="user", password="pw") == "token"
+
+    page.wait_for_selector.assert_called_once_with('input[name="user[email]"]', timeout=500)
+
+
+def test_sign_in_fails_once_the_challenge_budget_is_spent() -> None:
+    page = _login_page(challenged=True)
+    page.wait_for_load_state.side_effect = PlaywrightTimeoutError("networkidle timed out")
+    page.wait_for_selector.side_effect = PlaywrightTimeoutError("selector timed out")
+    with (
+        mock.patch.object(play_by_point.time, "monotonic", side_effect=[100.0, 160.2]),
+        pytest.raises(RuntimeError, match="Could not load login page"),
+    ):
+        PlayByPointClient._sign_in(page, username="user", password="pw")
+
+    # Never 0, which Playwright would take as no timeout at all
+    page.wait_for_selector.assert_called_once_with('input[name="user[email]"]', timeout=1.0)
+
+
+@pytest.fixture
+def signed_in_page(make_response: ResponseFactory) -> requests.Response:
+    return make_response(200, b'<meta name="csrf-token" content="fresh">', url=DASHBOARD_URL)
+
+
+@pytest.mark.parametrize("status", [401, 403, 422])
+def test_api_put_refreshes_a_rejected_csrf_token_and_retries_once(
+    client: PlayByPointClient, status: int, make_response: ResponseFactory, signed_in_page: requests.Response
+) -> None:
+    sent_tokens = []
+
+    def request(method: str, url: str, **kwargs: Any) -> requests.Response:
+        sent_tokens.append(client._session.headers["X-CSRF-Token"])
+        return make_response(200 if client._session.headers["X-CSRF-Token"] == "fresh" else status, {})
+
+    with (
+        mock.patch.object(client._session, "request", side_effect=request),
+        mock.patch.object(client._session, "get", return_value=signed_in_page) as get,
+    ):
+        assert client._api_put(RULES_URL, [("owner", "42")]) == {}
+
+    assert sent_tokens == ["token", "fresh"]
+    get.assert_called_once()
+
+
+def test_api_put_refreshes_once_for_concurrent_rejections(
+    client: PlayByPointClient, make_response: ResponseFactory, signed_in_page: requests.Response
+) -> None:
+    def request(method: str, url: str, **kwargs: Any) -> requests.Response:
+        return make_response(200 if client._session.headers["X-CSRF-Token"] == "fresh" else 422, {})
+
+    with (
+        mock.patch.object(client._session, "request", side_effect=request),
+        mock.patch.object(client._session, "get", return_value=signed_in_page) as get,
+        ThreadPoolExecutor(max_workers=8) as executor,
+    ):
+        for future in [executor.submit(client._api_put, RULES_URL, [("owner", "42")]) for _ in range(16)]:
+            assert future.result() == {}
+
+    get.assert_called_once()
+
+
+def test_api_put_gives_up_when_the_session_is_signed_out(
+    client: PlayByPointClient, make_response: ResponseFactory
+) -> None:
+    signed_out = make_response(200, b"<form>", url=play_by_point._SIGN_IN_URL)
+    with (
+        mock.patch.object(client._session, "request", return_value=make_response(422, {})) as request,
+        mock.patch.object(client._session, "get", return_value=signed_out),
+        pytest.raises(RuntimeError, match="status 422"),
+    ):
+        client._api_put(RULES_URL, [("owner", "42")])
+
+    request.assert_called_once()
+
+
+@pytest.fixture
+def fresh_login() -> Iterator[tuple[requests.Session, mock.Mock]]:
+    """Patches from_login to hand out a client whose session the fake server accepts."""
+    fresh = requests.Session()
+    with mock.patch.object(PlayByPointClient, "from_login", return_value=PlayByPointClient(fresh)) as from_login:
+        yield fresh, from_login
+
+
+def _accept_only(session: requests.Session, make_response: ResponseFactory) -> Callable[..., requests.Response]:
+    def request(self: requests.Session, method: str, url: str, **kwargs: Any) -> requests.Response:
+        return make_response(200, {}) if self is session else make_response(401, {})
+
+    return request
+
+
+def test_rejected_session_signs_in_again_and_retries_once(
+    client: PlayByPointClient,
+    make_response: ResponseFactory,
+    fresh_login: tuple[requests.Session, mock.Mock],
+) -> None:
+    fresh, from_login = fresh_login
+    client._credentials = ("user", "pw")
+    with mock.patch.object(
+        requests.Session, "request", autospec=True, side_effect=_accept_only(fresh, make_response)
+    ) as request:
+        assert client._api_get(RULES_URL) == {}
+
+    assert request.call_count == 2
+    from_login.assert_called_once_with(username="user", password="pw")
+    assert client._session is fresh
+
+
+def test_rejected_session_signs_in_again_once_for_concurrent_requests(
+    client: PlayByPointClient,
+    make_response: ResponseFactory,
+    fresh_login: tuple[requests.Session, mock.Mock],
+) -> None:
+    fresh, from_login = fresh_login
+    client._credentials = ("user", "pw")
+    with (
+        mock.patch.object(requests.Session, "request", autospec=True, side_effect=_accept_only(fresh, make_response)),
+        ThreadPoolExecutor(max_workers=8) as executor,
+    ):
+        for future in [executor.submit(client._api_get, RULES_URL) for _ in range(16)]:
+            assert future.result() == {}
+
+    from_login.assert_called_once()
+
+
+def test_rejected_session_without_credentials_evicts(
+    client: PlayByPointClient,
+    make_response: ResponseFactory,
+    fresh_login: tuple[requests.Session, mock.Mock],
+) -> None:
+    fresh, from_login = fresh_login
+    play_by_point._pool["user"] = (client, 0.0, 1)
+    with (
+        mock.patch.object(requests.Session, "request", autospec=True, side_effect=_accept_only(fresh, make_response)),
+        pytest.raises(RuntimeError, match="status 401"),
+    ):
+        client._api_get(RULES_URL)
+
+    from_login.assert_not_called()
+    assert "user" not in play_by_point._pool
+
+
+def test_failed_relogin_is_not_repeated(
+    client: PlayByPointClient, make_response: ResponseFactory, fresh_login: tuple[requests.Session, mock.Mock]
+) -> None:
+    fresh, from_login = fresh_login
+    from_login.side_effect = RuntimeError("Cloudflare says no")
+    client._credentials = ("user", "pw")
+    with mock.patch.object(requests.Session, "request", autospec=True, side_effect=_accept_only(fresh, make_response)):
+        for _ in range(2):
+            with pytest.raises(RuntimeError, match="status 401"):
+                client._api_get(RULES_URL)
+
+    from_login.assert_called_once()
+
+
+def test_browser_calls_run_on_one_thread() -> None:
+    def fail() -> None:
+        raise ValueError("boom")
+
+    threads = {play_by_point._run_on_browser_thread(threading.current_thread) for _ in range(3)}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        threads |= set(executor.map(lambda _: play_by_point._run_on_browser_thread(threading.current_thread), range(8)))
+
+    assert threads == {play_by_point._browser_thread}
+    with pytest.raises(ValueError, match="boom"):
+        play_by_point._run_on_browser_thread(fail)